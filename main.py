@@ -1,88 +1,186 @@
-from collections import defaultdict
+from array import array
+import numpy as np
 import random
 import string
 
-# Let's load some text from a specified file
-def load_text(file_path):
-    try:
-        with open(file_path, 'r') as file:
-            text = file.read()
-        return text
-    except FileNotFoundError:
-        print(f"Error: Can't find the file at {file_path}")
-        return ""
-    except Exception as e:
-        print(f"Error: {e}")
-        return ""
+# These tables let us clean up the raw bytes in a single pass instead of decoding first
+# LOWERCASE_TABLE maps A-Z to a-z and leaves every other byte alone (so utf-8 characters survive)
+# PUNCTUATION is the set of bytes we delete along the way
+LOWERCASE_TABLE = bytes.maketrans(string.ascii_uppercase.encode(), string.ascii_lowercase.encode())
+PUNCTUATION = string.punctuation.encode()
+
+# Let's read the words from a specified file, one line at a time
+# so we never hold the whole text (or a giant list of words) in memory at once
+# each line is cleaned up as raw bytes: remove punctuation and convert to lowercase in one pass, then decode
+# (a line never splits a utf-8 character in half, so decoding line by line is safe)
+def stream_words(file_path):
+    with open(file_path, 'rb') as file:
+        for line in file:
+            line = line.translate(LOWERCASE_TABLE, PUNCTUATION).decode('utf-8')
+            if not line.isascii():
+                line = line.lower()  # the byte table only knows about ASCII letters
+            yield from line.split()
+
+# Contexts are stored as one int instead of a tuple of k ids: every id gets the same number of bits
+# and they sit side by side, so the context (3, 1, 2) with 2 bits per id becomes 0b11_01_10
+# an int hashes in one go, a tuple has to hash every element each time we look it up
+def id_bits(vocab):
+    return max(1, (len(vocab) - 1).bit_length())
+
+def pack_context(ids, bits):
+    key = 0
+    for word_id in ids:
+        key = (key << bits) | word_id
+    return key
+
+# and back again, the first word sits in the highest bits
+def unpack_context(key, bits, k):
+    mask = (1 << bits) - 1
+    return [(key >> (bits * j)) & mask for j in reversed(range(k))]
 
 # Here we build our Markov Chain, pretty cool stuff
 # how this works is we take a list of words and a context size k
-# and we create a dictionary where each key is a k-word context
-# and the value is a list of the next words that follow that context
+# and we collect, for each k-word context, the next words that follow that context
 # so if we have the context "hello world" and the next word is "foo"
-# then we would add "foo" to the list of successors for the key "hello world"
+# then we would add "foo" to the successors for the key "hello world"
 # and we do this for every k-word context in the text
+# first every word gets swapped for a small integer id (vocab maps word -> id)
+# so numpy can chew through the whole text as one array of ints
+# at the end everything gets packed into flat arrays (see below) instead of one little list per context
 
 def build_markov_chain(words, k):
-    chain = defaultdict(list)
-    # defaultdict is a dictionary that automatically initializes the value for a key that doesn't exist 
-    # as a list, so we don't have to do that manually. this is important because some contexts will not have any successors
-    # we iterate over the words and for each k-word context, we add the next word to the list of successors
-    for i in range(len(words) - k):
-        context = tuple(words[i:i+k])  # This is our k-word context
-        successor = words[i+k]        # And this is the next word
-        chain[context].append(successor)
-    return chain
+    # a plain dict + setdefault hands out the next id to new words without any python-level factory call
+    vocab = {}
+    vocab_setdefault = vocab.setdefault  # look it up once, this runs for every single word
+    # words can be any iterable (even a generator reading a file), we only keep the ids
+    ids = np.fromiter((vocab_setdefault(word, len(vocab)) for word in words), dtype=np.int32)
+    if len(ids) <= k:
+        raise ValueError(f"Context size k={k} is too large for the text provided.")
+    # instead of looping over the text in python, numpy does the grouping on the whole id array at once
+    # windows[i] is the k-word context starting at i (a view into ids, nothing is copied)
+    # and next_ids[i] is the word that comes right after it
+    windows = np.lib.stride_tricks.sliding_window_view(ids, k)[:-1]
+    next_ids = ids[k:]
+    # np.unique sorts the contexts so identical ones end up together
+    # contexts holds each different context (as a packed int) once, ctx_of[i] says which one windows[i] is
+    bits = id_bits(vocab)
+    if bits * k <= 64:
+        # the whole context fits in a 64-bit number, so numpy can pack every window at once
+        keys = np.zeros(len(windows), dtype=np.uint64)
+        for j in range(k):
+            keys = (keys << np.uint64(bits)) | windows[:, j].astype(np.uint64)
+        contexts, ctx_of = np.unique(keys, return_inverse=True)
+        contexts = contexts.tolist()
+    else:
+        # too big for numpy's ints (huge k or a huge vocabulary), so instead we boil each window down
+        # to a 64-bit hash (h = h * P + id, numpy just wraps around on overflow) and group by that,
+        # which is way faster than np.unique sorting whole rows
+        hashes = np.zeros(len(windows), dtype=np.uint64)
+        for j in range(k):
+            hashes = hashes * np.uint64(1000003) + windows[:, j].astype(np.uint64)
+        _, first, ctx_of = np.unique(hashes, return_index=True, return_inverse=True)
+        # two different contexts could share a hash (super unlikely, but still), so we check every
+        # window against the first window with its hash, and group the rows the slow way if any differ
+        if not (windows == windows[first[ctx_of.reshape(-1)]]).all():
+            _, first, ctx_of = np.unique(windows, axis=0, return_index=True, return_inverse=True)
+        # python packs the different contexts, python ints can be as big as they need
+        contexts = [pack_context(context, bits) for context in windows[first].tolist()]
+    # every next word goes into one flat array, grouped by context (a stable sort keeps text order inside a group)
+    # context c owns successors[offsets[c]:offsets[c+1]], a word that follows c 5 times shows up 5 times
+    # so picking a random slot picks each next word exactly as often as it showed up
+    # a couple of big arrays of 4 byte numbers is way smaller than a python list per context
+    # (the numpy arrays are copied straight into the arrays as raw bytes, no list of python ints in between)
+    ctx_of = ctx_of.reshape(-1)
+    successors = array('i')
+    successors.frombytes(next_ids[np.argsort(ctx_of, kind="stable")].astype(np.intc).tobytes())
+    offsets = array('i', [0])
+    offsets.frombytes(np.cumsum(np.bincount(ctx_of, minlength=len(contexts))).astype(np.intc).tobytes())
+    # and a dictionary to go from a context to its number
+    # (the contexts list goes the other way, generate_text needs it to work out the next context)
+    ctx_ids = {context: c for c, context in enumerate(contexts)}
+    # dicts keep insertion order, so position i in this list is the word with id i
+    # (built once here so generating text doesn't redo it every time)
+    id_to_word = list(vocab)
+    chain = (ctx_ids, contexts, offsets, successors, id_to_word)
+    return chain, vocab
+
 
+# How many random numbers igenerate_text asks numpy for at a time
+DRAW_BLOCK = 4096
 
 # Now we generate some text using our Markov Chain
 # we start with a given context and then we keep picking a random successor
 # until we have generated the desired length of text
 # we keep updating the context to the last k words of the sentence as we generate new words
 # this way we can keep track of what we've said before and use that to generate the next word
-def generate_text(chain, start_context, length):
+# the chain only knows word ids, so we use the vocab to go from words to ids and back
+# this is a generator, it hands out the words one at a time as they get picked
+# so the streamlit app can show them as they come without waiting for the whole text
+def igenerate_text(chain, vocab, start_context, length):
     # we start with the first k words of the sentence
-    sentence = list(start_context)
-    # we also keep track of the current context, which is the last k words of the sentence
-    current_context = start_context
+    yield from start_context
+    # we also keep track of the current context, as its number in the chain
+    # (if the start has a word we've never seen, that's not a context we know, so it's just a dead end)
+    k = len(start_context)
+    ctx_ids, contexts, offsets, successors, id_to_word = chain
+    bits = id_bits(vocab)
+    mask = (1 << bits * k) - 1  # keeps only the last k ids of a packed context
+    start_ids = [vocab.get(word) for word in start_context]
+    c = None if None in start_ids else ctx_ids.get(pack_context(start_ids, bits))
+    # look these up once instead of every time around the loop
+    ctx_get = ctx_ids.get
+    randrange = random.randrange
+    # calling random over and over from python is slow, so numpy draws a whole block of random numbers at once
+    # (seeded from random, so random.seed still makes the output repeatable)
+    # one uniform number per word: u * n picks the slot
+    rng = np.random.default_rng(random.getrandbits(64))
     
     # we keep generating words until we have the desired length
-    for _ in range(length - len(start_context)):
-        successors = chain.get(current_context, [])
-        if not successors:
-            # If we hit a dead end, let's just pick a random context to keep going
-            current_context = random.choice(list(chain.keys()))
-            continue
-        next_word = random.choice(successors)  # Pick a successor, you know, randomly
-        sentence.append(next_word) # add the next word to the sentence
-        current_context = tuple(sentence[-len(current_context):])  # Update the context
-    
-    return " ".join(sentence)
+    # the random numbers come from numpy a block at a time, so a really long text
+    # doesn't need a giant list of them up front (and the first words come out right away)
+    for block_start in range(0, length - k, DRAW_BLOCK):
+        for u in rng.random(min(DRAW_BLOCK, length - k - block_start)).tolist():
+            if c is None:
+                # If we hit a dead end, let's just jump to a random context to keep going
+                # (and still pick a word from it, so we don't come up short)
+                c = randrange(len(contexts))
+            # Pick a successor, you know, randomly (repeats make it weighted by how often it showed up)
+            start = offsets[c]
+            next_id = successors[start + int(u * (offsets[c + 1] - start))]
+            yield id_to_word[next_id]  # hand out the next word of the sentence
+            # Update the context: drop the oldest word, add the new one
+            c = ctx_get(((contexts[c] << bits) | next_id) & mask)
+
+# Same thing, but all at once as one string
+def generate_text(chain, vocab, start_context, length):
+    return " ".join(igenerate_text(chain, vocab, start_context, length))
 
 # Main execution starts here
 if __name__ == "__main__":
     # Specify the path to the text file we want to use
     file_path = "./seinfeld-script.txt"  # Make sure to update this with the correct path
-    text = load_text(file_path)
-    
-    # Preprocess the text: remove newlines, punctuation, and convert to lowercase
-    words = text.replace('\n', ' ').translate(str.maketrans('', '', string.punctuation)).lower().split()
 
     # Ask the user for the context size and the number of words to generate
     k = int(input("Enter the context size (k): "))
     num_words = int(input("Enter the number of words to generate: "))
 
-    if k >= len(words):
-        print(f"Error: Context size k={k} is too large for the text provided.")
+    # Build the Markov Chain straight from the words as they are read from the file
+    try:
+        markov_chain, vocab = build_markov_chain(stream_words(file_path), k)
+    except FileNotFoundError:
+        print(f"Error: Can't find the file at {file_path}")
+        exit()
+    except Exception as e:  # includes the "k is too large for the text" error
+        print(f"Error: {e}")
         exit()
-
-    # Build the Markov Chain from the words
-    markov_chain = build_markov_chain(words, k)
 
     # Select a random starting context for text generation
-    start_index = random.randint(0, len(words) - k)
-    start_context = tuple(words[start_index:start_index + k])
+    # (we never kept the list of words around, so pick one of the contexts in the chain)
+    # contexts are packed ints, so unpack the ids again and look up their words
+    _, contexts, _, _, id_to_word = markov_chain
+    start_ids = unpack_context(random.choice(contexts), id_bits(vocab), k)
+    start_context = tuple(id_to_word[word_id] for word_id in start_ids)
 
     # Generate the text based on the Markov Chain
-    generated_text = generate_text(markov_chain, start_context, num_words)
+    generated_text = generate_text(markov_chain, vocab, start_context, num_words)
     print(generated_text)
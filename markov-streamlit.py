@@ -1,64 +1,63 @@
 import streamlit as st
-from collections import defaultdict, Counter
+from collections import Counter
 import random
-import string
-import pandas as pd
 import time
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+# the Markov chain itself lives in main.py (its command line part only runs under __main__, so importing it is safe)
+from main import LOWERCASE_TABLE, PUNCTUATION, build_markov_chain, igenerate_text, generate_text
+
+# Dynamic generation shows the text this many words at a time
+DYNAMIC_BATCH = 8
+# and takes about this many seconds in total, no matter how many words
+DYNAMIC_SECONDS = 2.0
 
 
 # This function cleans up the text a bit 
 # removes punctuation and converts the text to lowercase
-# replaces newlines with spaces and splits the text into a list of words
-def preprocess_text(text, remove_punctuation=True, convert_lowercase=True):
-    if remove_punctuation:
-        text = text.translate(str.maketrans('', '', string.punctuation))
-    if convert_lowercase:
-        text = text.lower()
-    return text.replace('\n', ' ').split()
+# both happen in one bytes.translate pass over the raw upload, then we decode and split into words
+# st.cache_data remembers the result, so streamlit reruns (every widget click!) don't redo any of this
+@st.cache_data(show_spinner=False)
+def preprocess_text(raw, remove_punctuation=True, convert_lowercase=True):
+    table = LOWERCASE_TABLE if convert_lowercase else None
+    delete = PUNCTUATION if remove_punctuation else b""
+    text = raw.translate(table, delete).decode("utf-8")
+    if convert_lowercase and not text.isascii():
+        text = text.lower()  # the byte table only knows about ASCII letters
+    return tuple(text.split())
 
-# Here we build our Markov Chain, pretty cool stuff
-# how this works is we take a list of words and a context size k
-# and we create a dictionary where each key is a k-word context
-# and the value is a list of the next words that follow that context
-# so if we have the context "hello world" and the next word is "foo"
-# then we would add "foo" to the list of successors for the key "hello world"
-# and we do this for every k-word context in the text
+# Counting every word for the frequency chart is a full pass over the text, so cache that too
+# only the top 20 make it into the chart, and most_common(20) finds those without sorting every word
+# the cache key is the raw upload + cleanup options (same as preprocess_text), hashing all the words would be slow
+@st.cache_data(show_spinner=False)
+def top_words(raw, remove_punctuation, convert_lowercase):
+    words = preprocess_text(raw, remove_punctuation, convert_lowercase)
+    return tuple(Counter(words).most_common(20))  # a tuple of (word, count) pairs makes a cheap cache key
 
-def build_markov_chain(words, k):
-    chain = defaultdict(list)
-    # defaultdict is a dictionary that automatically initializes the value for a key that doesn't exist 
-    # as a list, so we don't have to do that manually. this is important because some contexts will not have any successors
-    # we iterate over the words and for each k-word context, we add the next word to the list of successors
-    for i in range(len(words) - k):
-        context = tuple(words[i:i+k])  # This is our k-word context
-        successor = words[i+k]        # And this is the next word
-        chain[context].append(successor)
-    return chain
+# Drawing the chart, 20 bars is cheap so we just draw it fresh each time
+# (a cached figure would be shared by every session, and st.pyplot changes it while saving it)
+# a plain Figure instead of plt.subplots() never goes into pyplot's global list of open figures,
+# so nothing piles up across reruns
+def make_figure(top):
+    fig = Figure()
+    ax = fig.subplots()
+    # 20 bars is simple enough to hand straight to matplotlib, no need for a pandas DataFrame
+    ax.bar([word for word, _ in top], [count for _, count in top], label="Count")
+    ax.tick_params(axis="x", labelrotation=90)
+    ax.set_xlabel("Word")
+    ax.legend()
+    return fig
 
-# Now we generate some text using our Markov Chain
-# we start with a given context and then we keep picking a random successor
-# until we have generated the desired length of text
-# we keep updating the context to the last k words of the sentence as we generate new words
-# this way we can keep track of what we've said before and use that to generate the next word
-def generate_text(chain, start_context, length):
-    # we start with the first k words of the sentence
-    sentence = list(start_context)
-    # we also keep track of the current context, which is the last k words of the sentence
-    current_context = start_context
-    
-    # we keep generating words until we have the desired length
-    for _ in range(length - len(start_context)):
-        successors = chain.get(current_context, [])
-        if not successors:
-            # If we hit a dead end, let's just pick a random context to keep going
-            current_context = random.choice(list(chain.keys()))
-            continue
-        next_word = random.choice(successors)  # Pick a successor, you know, randomly
-        sentence.append(next_word) # add the next word to the sentence
-        current_context = tuple(sentence[-len(current_context):])  # Update the context
-    
-    return " ".join(sentence)
+# The chain is kept in st.session_state, so clicking "Generate Text" again doesn't rebuild it
+# it's stored with the (file, k, cleanup options) it was built from and only rebuilt when one of those changes
+# (st.cache_data would have to hash all the words and hand back a fresh copy of the chain on every click)
+def get_markov_chain(uploaded_file, words, k, remove_punctuation, convert_lowercase):
+    chain_key = (uploaded_file.file_id, k, remove_punctuation, convert_lowercase)
+    cached = st.session_state.get("markov_chain")
+    if cached is None or cached[0] != chain_key:
+        with st.spinner("Building the Markov chain..."):
+            cached = (chain_key, build_markov_chain(words, k))
+        st.session_state["markov_chain"] = cached  # only one chain at a time, the old one can go
+    return cached[1]
 
 # Here comes the main part of our Streamlit app
 def main():
@@ -78,10 +77,10 @@ def main():
     
     if uploaded_file:
         # Load and clean up the text
-        text = uploaded_file.read().decode("utf-8")
+        raw = uploaded_file.getvalue()  # raw bytes, cheap for the cache to hash
         remove_punctuation = st.checkbox("Remove punctuation?", value=True)
         convert_lowercase = st.checkbox("Convert text to lowercase?", value=True)
-        words = preprocess_text(text, remove_punctuation, convert_lowercase)
+        words = preprocess_text(raw, remove_punctuation, convert_lowercase)
         
         st.write("### Uploaded Text Sample")
         st.text(" ".join(words[:100]))  # Just show a little bit of the text
@@ -92,11 +91,7 @@ def main():
 
         # Let's visualize how often words show up
         if st.checkbox("Show word frequency chart?"):
-            word_counts = Counter(words)
-            freq_df = pd.DataFrame(word_counts.items(), columns=["Word", "Count"]).sort_values(by="Count", ascending=False).head(20)
-            fig, ax = plt.subplots()
-            freq_df.set_index("Word").plot(kind="bar", ax=ax)
-            st.pyplot(fig)
+            st.pyplot(make_figure(top_words(raw, remove_punctuation, convert_lowercase)))
 
         # Get the context size (k) from the user
         k = st.number_input("Enter the context size (k):", min_value=1, max_value=50, value=3, step=1)
@@ -128,24 +123,30 @@ def main():
         # Decide if we want to generate text word by word or all at once
         if st.checkbox("Generate text dynamically (word by word)?"):
             if st.button("Generate Text Dynamically"):
-                markov_chain = build_markov_chain(words, k)
-                generated_text = generate_text(markov_chain, start_context, num_words)
+                markov_chain, vocab = get_markov_chain(uploaded_file, words, k, remove_punctuation, convert_lowercase)
                 
                 # Use a placeholder to show the text as we generate it
+                # the words come straight out of the generator, no need to build the whole text first
+                # st.text shows it as plain text, so punctuation like * or # doesn't turn into formatting
                 placeholder = st.empty()
-                current_text = ""  # Keep track of the text as we go
-                for word in generated_text.split():
-                    current_text += word + " "  # Add the new word to what we have
-                    placeholder.text(current_text.strip())  # Update the display
-                    time.sleep(0.1)  # A little delay for effect
+                shown_words = []  # Keep track of the text as we go (a list, so no growing string to copy each time)
+                # redrawing after every single word is slow, so we only update every few words
+                # and the little delay is spread out so the whole thing takes about 2 seconds, however long it is
+                delay = DYNAMIC_SECONDS * DYNAMIC_BATCH / num_words
+                for word in igenerate_text(markov_chain, vocab, start_context, num_words):
+                    shown_words.append(word)
+                    if len(shown_words) % DYNAMIC_BATCH == 0:
+                        placeholder.text(" ".join(shown_words))  # Update the display
+                        time.sleep(delay)  # A little delay for effect, otherwise it all shows up at once
+                placeholder.text(" ".join(shown_words))  # and whatever is left over at the end
 
         else:
             if st.button("Generate Text"):
-                # Build the Markov Chain
-                markov_chain = build_markov_chain(words, k)
+                # Build the Markov Chain (or reuse the one we already built)
+                markov_chain, vocab = get_markov_chain(uploaded_file, words, k, remove_punctuation, convert_lowercase)
                 
                 # Generate the text
-                generated_text = generate_text(markov_chain, start_context, num_words)
+                generated_text = generate_text(markov_chain, vocab, start_context, num_words)
                 
                 if len(generated_text.split()) < num_words:
                     st.warning("Not enough data to generate the requested number of words. Try reducing k or increasing text size.")